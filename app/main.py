@@ -1,59 +1,114 @@
 """FastAPI application with all three endpoints."""
-from fastapi import FastAPI, Depends, HTTPException, Query, Request
-from fastapi.responses import RedirectResponse
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import BackgroundTasks, FastAPI, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, RedirectResponse
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import Session
 
-from app.database import engine, Base, get_db
+from app.database import engine, Base, SessionLocal, get_async_session_factory, get_db
+from app.models import upgrade_schema
 from app.schemas import LinkCreate, LinkResponse, StatsResponse
-from app.services import create_link, get_link_by_short_code, record_click, get_stats
+from app.services import (
+    backfill_click_monthly,
+    create_link,
+    get_link_by_short_code,
+    get_stats,
+    record_click,
+)
 from app.utils import simulate_fraud_check
 
-app = FastAPI(title="Fiverr Shareable Links API", version="1.0.0")
+app = FastAPI(
+    title="Fiverr Shareable Links API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+)
 
 
 # Create tables - will only run when starting the server (not during tests)
 try:
     Base.metadata.create_all(bind=engine)
-except Exception:
+except OperationalError:
     # Ignore connection errors during test imports
     pass
+else:
+    # Outside the try so a failed upgrade or backfill stops the server
+    # instead of leaving it to fail on every insert or undercount stats
+    with engine.begin() as connection:
+        upgrade_schema(connection)
+    with SessionLocal() as db:
+        backfill_click_monthly(db)
 
 
-@app.post("/links", response_model=LinkResponse, status_code=201)
-def post_link(body: LinkCreate, request: Request, db: Session = Depends(get_db)):
-    """Generate a short link. Returns existing link if URL already exists."""
-    link, is_new = create_link(db, body.target_url)
+@lru_cache(maxsize=256)
+def _base_url(scheme: str, host: bytes | None, server: tuple | None, root_path: str) -> str:
+    """Build the base URL for one combination of the scope fields it depends on."""
+    headers = [(b"host", host)] if host is not None else []
+    scope = {"type": "http", "scheme": scheme, "server": server, "root_path": root_path, "path": "/", "headers": headers}
+    return str(Request(scope).base_url).rstrip("/")
 
-    base_url = str(request.base_url).rstrip("/")
-    response = LinkResponse(
-        short_code=link.short_code,
-        short_url=f"{base_url}/{link.short_code}",
-        target_url=link.target_url,
-        created_at=link.created_at,
+
+async def get_base_url(request: Request) -> str:
+    """FastAPI dependency that provides the app's base URL without a trailing slash."""
+    scope = request.scope
+    server = scope.get("server")
+    # Read the raw Host header straight from the scope rather than building request.headers
+    host = next((value for key, value in scope["headers"] if key == b"host"), None)
+    return _base_url(
+        scope.get("scheme", "http"),
+        host,
+        tuple(server) if server is not None else None,
+        scope.get("app_root_path", scope.get("root_path", "")),
     )
 
-    if is_new:
-        return response
 
-    # Return 200 for existing links instead of default 201
-    from fastapi.responses import JSONResponse
-    return JSONResponse(content=response.model_dump(mode="json"), status_code=200)
+@app.post(
+    "/links",
+    response_model=LinkResponse,
+    status_code=201,
+    responses={200: {"model": LinkResponse, "description": "Link already existed"}},
+)
+def post_link(body: LinkCreate, base_url: str = Depends(get_base_url), db: Session = Depends(get_db)):
+    """Generate a short link. Returns existing link if URL already exists."""
+    link, is_new = create_link(db, body.target_url)
+
+    # The row is already in response shape, so it skips LinkResponse validation
+    # and goes straight to orjson; 200 for existing links instead of 201
+    return ORJSONResponse(
+        content={
+            "short_code": link.short_code,
+            "short_url": f"{base_url}/{link.short_code}",
+            "target_url": link.target_url,
+            "created_at": link.created_at,
+        },
+        status_code=201 if is_new else 200,
+    )
 
 
 @app.get("/stats", response_model=StatsResponse)
 def get_global_stats(
-    page: int = Query(default=1, ge=1),
+    page: int = Query(default=1, ge=1, deprecated=True),
     limit: int = Query(default=20, ge=1, le=100),
+    cursor: Optional[str] = Query(default=None),
     db: Session = Depends(get_db),
 ):
-    """Global analytics with pagination and monthly breakdown."""
-    return get_stats(db, page=page, limit=limit)
+    """Global analytics with cursor pagination and monthly breakdown."""
+    try:
+        return get_stats(db, page=page, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @app.get("/{short_code}")
-async def redirect_short_link(short_code: str, db: Session = Depends(get_db)):
-    """Redirect to target URL after fraud check and click recording."""
-    link = get_link_by_short_code(db, short_code)
+async def redirect_short_link(
+    short_code: str,
+    background: BackgroundTasks,
+    session_factory: async_sessionmaker = Depends(get_async_session_factory),
+):
+    """Redirect to target URL after fraud check; the click is recorded once the response is sent."""
+    link = await get_link_by_short_code(session_factory, short_code)
     if not link:
         raise HTTPException(status_code=404, detail="Short link not found")
 
@@ -61,5 +116,5 @@ async def redirect_short_link(short_code: str, db: Session = Depends(get_db)):
     if not is_valid:
         raise HTTPException(status_code=403, detail="Click failed fraud validation")
 
-    record_click(db, link.id)
+    background.add_task(record_click, session_factory, link.id)
     return RedirectResponse(url=link.target_url, status_code=302)
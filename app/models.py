@@ -1,8 +1,8 @@
-"""SQLAlchemy models for Link and Click tables."""
+"""SQLAlchemy models for Link, Click and ClickMonthly tables."""
 import uuid
-from datetime import datetime, timezone
 
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Index
+from sqlalchemy import BigInteger, CHAR, Column, String, Text, DateTime, ForeignKey, Index, func, text
+from sqlalchemy.engine import Connection
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -15,7 +15,7 @@ class Link(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     short_code = Column(String(6), unique=True, nullable=False, index=True)
     target_url = Column(Text, unique=True, nullable=False)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     clicks = relationship("Click", back_populates="link", cascade="all, delete-orphan")
 
@@ -25,10 +25,57 @@ class Click(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     link_id = Column(UUID(as_uuid=True), ForeignKey("links.id"), nullable=False)
-    clicked_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    clicked_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     link = relationship("Link", back_populates="clicks")
 
 
+class ClickMonthly(Base):
+    """Per-link click counts by UTC month (YYYY-MM), maintained as clicks are recorded."""
+    __tablename__ = "click_monthly"
+
+    link_id = Column(UUID(as_uuid=True), ForeignKey("links.id", ondelete="CASCADE"), primary_key=True)
+    month = Column(CHAR(7), primary_key=True)
+    clicks = Column(BigInteger, nullable=False, default=0)
+
+
 # Index on clicks.link_id for fast aggregation queries
 Index("idx_clicks_link_id", Click.link_id)
+
+# Composite index matching the (created_at, id) keyset used by stats pagination
+Index("idx_links_created_id", Link.created_at.desc(), Link.id.desc())
+
+
+# Arbitrary key for the advisory lock that serialises schema upgrades across workers
+_UPGRADE_LOCK_KEY = 7_310_193
+
+
+def upgrade_schema(connection: Connection) -> None:
+    """
+    Bring links and clicks tables created by an older release up to date.
+
+    create_all never alters an existing table. The first schema stored
+    created_at and clicked_at as naive UTC timestamps with no database
+    default, so inserts that leave them to now() would fail on it. Indexes
+    added since are created too. Postgres only; safe to run on every start.
+    """
+    if connection.dialect.name != "postgresql":
+        return
+
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _UPGRADE_LOCK_KEY})
+    columns = connection.execute(text(
+        "SELECT table_name, column_name, data_type, column_default FROM information_schema.columns "
+        "WHERE table_schema = current_schema() "
+        "AND (table_name, column_name) IN (('links', 'created_at'), ('clicks', 'clicked_at'))"
+    )).all()
+    for table, column, data_type, column_default in columns:
+        if data_type == "timestamp without time zone":
+            # Old values were written as UTC
+            connection.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE timestamptz USING {column} AT TIME ZONE 'UTC'"
+            ))
+        if column_default is None:
+            connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT now()"))
+
+    for index in (*Link.__table__.indexes, *Click.__table__.indexes):
+        index.create(connection, checkfirst=True)
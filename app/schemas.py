@@ -1,6 +1,6 @@
 """Pydantic schemas for request/response validation."""
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, field_validator
 
@@ -48,4 +48,6 @@ class StatsResponse(BaseModel):
     page: int
     limit: int
     total_links: int
+    has_more: bool
+    next_cursor: Optional[str] = None
     links: List[LinkStats]
@@ -1,106 +1,292 @@
 """Business logic for link creation, click recording, and stats retrieval."""
-from sqlalchemy import func
+import base64
+import binascii
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+from sqlalchemy import bindparam, func, insert, select, text, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Row
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session, aliased, raiseload
 
-from app.models import Link, Click
+from app.models import Link, Click, ClickMonthly
 from app.utils import generate_short_code
 
 EARNINGS_PER_CLICK = 0.05
+LINK_CACHE_SIZE = 10_000
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Hot-path statements are built once with named bind parameters. Each call
+# then reuses the same construct, skipping per-request statement building, and
+# hits SQLAlchemy's compiled cache and the asyncpg adapter's prepared
+# statement cache.
+_upsert_link = postgresql.insert(Link).values(
+    id=bindparam("id"), short_code=bindparam("short_code"), target_url=bindparam("target_url")
+)
+_UPSERT_LINK = _upsert_link.on_conflict_do_update(
+    index_elements=["target_url"], set_={"target_url": _upsert_link.excluded.target_url}
+).returning(Link.id, Link.short_code, Link.target_url, Link.created_at)
+
+_INSERT_CLICK = (
+    insert(Click).values(link_id=bindparam("link_id")).returning(Click.id, Click.clicked_at)
+)
 
+_upsert_click_monthly = postgresql.insert(ClickMonthly).values(
+    link_id=bindparam("link_id"), month=bindparam("month"), clicks=1
+)
+_UPSERT_CLICK_MONTHLY = _upsert_click_monthly.on_conflict_do_update(
+    index_elements=["link_id", "month"], set_={"clicks": ClickMonthly.clicks + 1}
+)
 
-def create_link(db: Session, target_url: str) -> tuple[Link, bool]:
+# Only the columns a redirect needs, as a plain row: no Link instance to build,
+# no identity map entry and no created_at decoding per lookup
+_LINK_BY_SHORT_CODE = select(Link.id, Link.target_url).where(Link.short_code == bindparam("short_code"))
+
+
+def create_link(db: Session, target_url: str) -> tuple[Row, bool]:
     """
     Create a new short link or return existing one if URL already exists.
 
+    A single INSERT ... ON CONFLICT (target_url) DO UPDATE ... RETURNING
+    either creates the link or hands back the existing row. The link id is
+    generated here, so a returned id that differs from it means the URL was
+    already shortened.
+
     Returns:
-        Tuple of (link, is_new) where is_new indicates if a new link was created.
+        Tuple of (link, is_new) where link is a row with the link's columns and
+        is_new indicates if a new link was created.
     """
-    existing = db.query(Link).filter(Link.target_url == target_url).first()
-    if existing:
-        return existing, False
-
     max_attempts = 10
     for _ in range(max_attempts):
-        short_code = generate_short_code()
-        link = Link(short_code=short_code, target_url=target_url)
-        db.add(link)
+        link_id = uuid.uuid4()
+        params = {"id": link_id, "short_code": generate_short_code(), "target_url": target_url}
         try:
-            db.commit()
-            db.refresh(link)
-            return link, True
+            link = db.execute(_UPSERT_LINK, params).one()
         except IntegrityError:
+            # Short code collision with another link; try a fresh code
             db.rollback()
             continue
+        db.commit()
+        return link, link.id == link_id
 
     raise RuntimeError("Failed to generate unique short code after multiple attempts")
 
 
-def record_click(db: Session, link_id) -> Click:
-    """Record a click for a given link."""
-    click = Click(link_id=link_id)
-    db.add(click)
-    db.commit()
-    db.refresh(click)
+async def record_click(session_factory: async_sessionmaker, link_id) -> Row:
+    """
+    Record a click for a given link and return its (id, clicked_at) row.
+
+    Runs on its own session so it can be scheduled after the response, once
+    the request's session is closed. The click is counted in its monthly
+    rollup in the same transaction.
+    """
+    async with session_factory() as db:
+        click = (await db.execute(_INSERT_CLICK, {"link_id": link_id})).one()
+        await db.execute(
+            _UPSERT_CLICK_MONTHLY, {"link_id": link_id, "month": _utc_month(click.clicked_at)}
+        )
+        await db.commit()
     return click
 
 
-def get_link_by_short_code(db: Session, short_code: str) -> Link | None:
-    """Look up a link by its short code."""
-    return db.query(Link).filter(Link.short_code == short_code).first()
+def backfill_click_monthly(db: Session) -> None:
+    """
+    Build click_monthly from the clicks table if the rollup is empty.
+
+    Covers databases whose clicks were recorded before the rollup existed.
+    On Postgres the rollup is locked before the check is repeated, so a
+    concurrent backfill or record_click cannot add rows in between; clicks
+    recorded meanwhile wait for the commit and are counted on top.
+    """
+    if db.scalar(select(ClickMonthly.link_id).limit(1)) is not None:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE click_monthly IN EXCLUSIVE MODE"))
+        if db.scalar(select(ClickMonthly.link_id).limit(1)) is not None:
+            db.rollback()
+            return
+
+    # Group on the truncated UTC month so to_char runs once per group rather
+    # than once per click
+    month_start = func.date_trunc("month", func.timezone("UTC", Click.clicked_at))
+    db.execute(
+        insert(ClickMonthly).from_select(
+            ["link_id", "month", "clicks"],
+            select(Click.link_id, func.to_char(month_start, "YYYY-MM"), func.count())
+            .group_by(Click.link_id, month_start),
+        )
+    )
+    db.commit()
+
+
+def _utc_month(ts: datetime) -> str:
+    """Format a timestamp's UTC month as YYYY-MM."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+    return ts.strftime("%Y-%m")
+
+
+class LinkTarget(NamedTuple):
+    """The parts of a link a redirect needs."""
+    id: uuid.UUID
+    target_url: str
 
 
-def get_stats(db: Session, page: int = 1, limit: int = 20) -> dict:
+# short_code → LinkTarget, least recently used first
+_link_cache: OrderedDict[str, LinkTarget] = OrderedDict()
+
+
+async def get_link_by_short_code(session_factory: async_sessionmaker, short_code: str) -> LinkTarget | None:
+    """
+    Look up a link by its short code.
+
+    Short codes never change once issued, so resolved links are kept in an
+    in-process LRU cache and repeat lookups skip the database. Unknown codes
+    are not cached since they may be issued later.
+
+    The lookup runs on its own short session, so the connection goes back to
+    the pool before the caller's fraud check instead of idling in a
+    transaction through it.
+    """
+    target = _link_cache.get(short_code)
+    if target is not None:
+        _link_cache.move_to_end(short_code)
+        return target
+
+    async with session_factory() as db:
+        row = (await db.execute(_LINK_BY_SHORT_CODE, {"short_code": short_code})).first()
+    if row is None:
+        return None
+
+    target = _link_cache[short_code] = LinkTarget._make(row)
+    if len(_link_cache) > LINK_CACHE_SIZE:
+        _link_cache.popitem(last=False)
+    return target
+
+
+def clear_link_cache() -> None:
+    """Drop every cached short code lookup."""
+    _link_cache.clear()
+
+
+def _encode_cursor(created_at: datetime, link_id: uuid.UUID) -> str:
+    """Encode a keyset position as an opaque URL-safe cursor."""
+    if created_at.tzinfo is None:
+        # SQLite hands back naive UTC timestamps
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    micros = (created_at - _EPOCH) // timedelta(microseconds=1)
+    return base64.urlsafe_b64encode(f"{micros}:{link_id.hex}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """
+    Decode a cursor produced by _encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        micros, link_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return _EPOCH + timedelta(microseconds=int(micros)), uuid.UUID(hex=link_id)
+    except (binascii.Error, UnicodeError, ValueError, OverflowError):
+        raise ValueError("Invalid cursor") from None
+
+
+def get_stats(db: Session, page: int = 1, limit: int = 20, cursor: str | None = None) -> dict:
     """
     Get global analytics with pagination and monthly breakdown.
 
     Applies defaults: page < 1 → 1, limit > 100 → 100.
+
+    Links are ordered newest first by (created_at, id). When a cursor is given
+    the page starts right after it (keyset pagination) and page is ignored;
+    page-based offsets remain as a fallback for older clients.
+
+    The page of links joined to their click_monthly rollup rows and the
+    overall link count come back from one query and are bucketed per link
+    here. One link past the page is fetched to tell whether another page
+    follows.
+
+    Raises:
+        ValueError: If the cursor is malformed.
     """
     if page < 1:
         page = 1
     if limit > 100:
         limit = 100
 
-    offset = (page - 1) * limit
-    total_links = db.query(Link).count()
+    # Uncorrelated, so evaluated once per statement rather than per row
+    total_links = select(func.count()).select_from(Link).scalar_subquery()
+    page_query = select(Link, total_links.label("total_links"))
+    if cursor is not None:
+        cursor_ts, cursor_id = _decode_cursor(cursor)
+        page_query = page_query.where(tuple_(Link.created_at, Link.id) < (cursor_ts, cursor_id))
+        offset = 0
+    else:
+        offset = (page - 1) * limit
 
-    links = (
-        db.query(Link)
-        .order_by(Link.created_at.desc())
+    page_links = (
+        page_query
+        .order_by(Link.created_at.desc(), Link.id.desc())
         .offset(offset)
-        .limit(limit)
-        .all()
+        .limit(limit + 1)
+        .subquery()
     )
+    link = aliased(Link, page_links)
 
-    links_stats = []
-    for link in links:
-        total_clicks = db.query(Click).filter(Click.link_id == link.id).count()
-
-        monthly_data = (
-            db.query(
-                func.to_char(Click.clicked_at, "YYYY-MM").label("month"),
-                func.count(Click.id).label("clicks"),
-            )
-            .filter(Click.link_id == link.id)
-            .group_by("month")
-            .order_by("month")
-            .all()
-        )
+    rows = db.execute(
+        select(link, page_links.c.total_links, ClickMonthly.month, ClickMonthly.clicks)
+        .outerjoin(ClickMonthly, ClickMonthly.link_id == link.id)
+        .order_by(link.created_at.desc(), link.id.desc(), ClickMonthly.month)
+        # Touching link.clicks here would lazy-load one query per link; fail
+        # loudly instead. Use selectinload(Link.clicks) if rows are needed.
+        .options(raiseload("*"))
+    ).all()
+
+    if rows:
+        total_links = rows[0].total_links
+    elif cursor is None and not offset:
+        total_links = 0
+    else:
+        # Past the last page the count has no row to ride on
+        total_links = db.scalar(select(func.count()).select_from(Link))
+
+    links_stats = {}
+    last_link = None
+    has_more = False
+    for page_link, _, month, clicks in rows:
+        stats = links_stats.get(page_link.id)
+        if stats is None:
+            if len(links_stats) == limit:
+                # The extra link only signals that another page follows
+                has_more = True
+                break
+            stats = links_stats[page_link.id] = {
+                "short_code": page_link.short_code,
+                "target_url": page_link.target_url,
+                "total_clicks": 0,
+                "total_earnings": 0.0,
+                "monthly_breakdown": [],
+            }
+            last_link = page_link
+        # Links without clicks come back as a single row with a NULL month
+        if month is not None:
+            stats["total_clicks"] += clicks
+            stats["monthly_breakdown"].append({"month": month, "clicks": clicks})
 
-        links_stats.append({
-            "short_code": link.short_code,
-            "target_url": link.target_url,
-            "total_clicks": total_clicks,
-            "total_earnings": round(total_clicks * EARNINGS_PER_CLICK, 2),
-            "monthly_breakdown": [
-                {"month": month, "clicks": clicks}
-                for month, clicks in monthly_data
-            ],
-        })
+    for stats in links_stats.values():
+        stats["total_earnings"] = round(stats["total_clicks"] * EARNINGS_PER_CLICK, 2)
 
     return {
         "page": page,
         "limit": limit,
         "total_links": total_links,
-        "links": links_stats,
+        "has_more": has_more,
+        "next_cursor": _encode_cursor(last_link.created_at, last_link.id) if has_more else None,
+        "links": list(links_stats.values()),
     }
@@ -1,13 +1,23 @@
 """Short code generation and fraud check simulation."""
 import asyncio
-import random
+import secrets
 import string
 
+_ALPHABET = (string.ascii_lowercase + string.digits).encode()
+# Bytes at or above the largest multiple of 36 are dropped so every character
+# is equally likely; the rest map straight onto the alphabet
+_UNBIASED_LIMIT = 256 - 256 % len(_ALPHABET)
+_BYTE_TO_CHAR = bytes(_ALPHABET[b % len(_ALPHABET)] for b in range(256))
+_REJECTED_BYTES = bytes(range(_UNBIASED_LIMIT, 256))
+
 
 def generate_short_code(length: int = 6) -> str:
-    """Generate a random alphanumeric lowercase short code (a-z, 0-9)."""
-    characters = string.ascii_lowercase + string.digits
-    return "".join(random.choice(characters) for _ in range(length))
+    """Generate a cryptographically random lowercase short code (a-z, 0-9)."""
+    while True:
+        # A couple of spare bytes make a redraw for rejected bytes very rare
+        code = secrets.token_bytes(length + 2).translate(_BYTE_TO_CHAR, _REJECTED_BYTES)
+        if len(code) >= length:
+            return code[:length].decode()
 
 
 async def simulate_fraud_check() -> bool:
@@ -1,28 +1,48 @@
 """Test configuration and fixtures."""
 import pytest
 from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
+from sqlalchemy.sql.functions import now
 from fastapi.testclient import TestClient
 
-from app.database import Base, get_db
+from app.database import Base, get_async_session_factory, get_db
 from app.main import app
+from app.services import clear_link_cache
 from app import models  # Import models to ensure they're registered with Base
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# A named shared-cache in-memory database, so the sync and async engines see
+# the same tables
+SQLALCHEMY_DATABASE_URL = "sqlite:///file:testdb?mode=memory&cache=shared&uri=true"
+SQLALCHEMY_ASYNC_DATABASE_URL = "sqlite+aiosqlite:///file:testdb?mode=memory&cache=shared&uri=true"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,  # Use StaticPool to maintain single connection
+    poolclass=StaticPool,  # Use StaticPool to maintain single connection (and keep the database alive)
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# NullPool: each TestClient runs its own event loop, so connections are not reused across tests
+async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
-# Register a SQLite-compatible to_char so services.py works in tests
+
+# Register SQLite-compatible to_char, date_trunc and timezone so services.py works in tests
 @event.listens_for(engine, "connect")
 def register_functions(dbapi_conn, connection_record):
     dbapi_conn.create_function("to_char", 2, lambda dt, fmt: dt[:7] if dt else None)
+    dbapi_conn.create_function("date_trunc", 2, lambda unit, dt: f"{dt[:7]}-01 00:00:00" if dt else None)
+    dbapi_conn.create_function("timezone", 2, lambda zone, dt: dt)
+
+
+# SQLite's CURRENT_TIMESTAMP has no fractional seconds and does not match the
+# format SQLAlchemy binds datetimes with, which breaks keyset comparisons
+@compiles(now, "sqlite")
+def sqlite_now(element, compiler, **kw):
+    return "(strftime('%Y-%m-%d %H:%M:%f000', 'now'))"
 
 
 def override_get_db():
@@ -38,7 +58,20 @@ def client():
     """Test client with a fresh in-memory database per test."""
     Base.metadata.create_all(bind=engine)
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_session_factory] = lambda: TestingAsyncSessionLocal
     with TestClient(app) as c:
         yield c
     app.dependency_overrides.clear()
     Base.metadata.drop_all(bind=engine)
+    # Cached short codes would otherwise outlive the per-test database
+    clear_link_cache()
+
+
+@pytest.fixture
+def db(client):
+    """Direct session on the test database for rows the API cannot create."""
+    session = TestingSessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
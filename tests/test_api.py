@@ -1,4 +1,9 @@
 """Automated tests for all three endpoints."""
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import Click, Link
+from app.services import backfill_click_monthly
 
 
 # ──────────────────────────────────────
@@ -28,6 +33,27 @@ class TestPostLinks:
         resp2 = client.post("/links", json={"target_url": "https://fiverr.com/b/svc2"})
         assert resp1.json()["short_code"] != resp2.json()["short_code"]
 
+    def test_short_url_follows_host_and_root_path(self, client):
+        resp_a = client.post(
+            "/links", json={"target_url": "https://fiverr.com/host/a"}, headers={"host": "a.example"}
+        )
+        with TestClient(app, root_path="/api") as prefixed:
+            resp_b = prefixed.post(
+                "/links", json={"target_url": "https://fiverr.com/host/b"}, headers={"host": "b.example:8080"}
+            )
+
+        assert resp_a.json()["short_url"] == f"http://a.example/{resp_a.json()['short_code']}"
+        assert resp_b.json()["short_url"] == f"http://b.example:8080/api/{resp_b.json()['short_code']}"
+
+    def test_short_code_collision_retries_with_fresh_code(self, client, monkeypatch):
+        taken = client.post("/links", json={"target_url": "https://fiverr.com/a/first"}).json()["short_code"]
+        codes = iter([taken, taken, "free01"])
+        monkeypatch.setattr("app.services.generate_short_code", lambda: next(codes, "free02"))
+
+        resp = client.post("/links", json={"target_url": "https://fiverr.com/b/second"})
+        assert resp.status_code == 201
+        assert resp.json()["short_code"] == "free01"
+
     def test_missing_target_url(self, client):
         resp = client.post("/links", json={})
         assert resp.status_code == 422
@@ -83,6 +109,42 @@ class TestRedirect:
         assert link["total_clicks"] == 5
         assert link["total_earnings"] == 0.25
 
+    def test_repeat_redirect_served_from_cache(self, client, db):
+        target = "https://fiverr.com/test/cached"
+        short_code = client.post("/links", json={"target_url": target}).json()["short_code"]
+        client.get(f"/{short_code}", follow_redirects=False)
+
+        db.query(Link).filter(Link.short_code == short_code).delete()
+        db.commit()
+
+        resp = client.get(f"/{short_code}", follow_redirects=False)
+        assert resp.status_code == 302
+        assert resp.headers["location"] == target
+
+    def test_unknown_code_not_cached(self, client, db):
+        assert client.get("/late01", follow_redirects=False).status_code == 404
+
+        db.add(Link(short_code="late01", target_url="https://fiverr.com/test/late"))
+        db.commit()
+
+        assert client.get("/late01", follow_redirects=False).status_code == 302
+
+    def test_cache_evicts_least_recently_used(self, client, db, monkeypatch):
+        monkeypatch.setattr("app.services.LINK_CACHE_SIZE", 2)
+        a, b, c = (
+            client.post("/links", json={"target_url": f"https://fiverr.com/lru/{name}"}).json()["short_code"]
+            for name in "abc"
+        )
+        for code in (a, b, a, c):  # a is used again after b, so b is evicted by c
+            client.get(f"/{code}", follow_redirects=False)
+
+        db.query(Link).delete()
+        db.commit()
+
+        assert client.get(f"/{a}", follow_redirects=False).status_code == 302
+        assert client.get(f"/{b}", follow_redirects=False).status_code == 404
+        assert client.get(f"/{c}", follow_redirects=False).status_code == 302
+
 
 # ──────────────────────────────────────
 # GET /stats
@@ -93,7 +155,14 @@ class TestStats:
         resp = client.get("/stats")
         assert resp.status_code == 200
         data = resp.json()
-        assert data == {"page": 1, "limit": 20, "total_links": 0, "links": []}
+        assert data == {
+            "page": 1,
+            "limit": 20,
+            "total_links": 0,
+            "has_more": False,
+            "next_cursor": None,
+            "links": [],
+        }
 
     def test_stats_with_links(self, client):
         for i in range(3):
@@ -117,6 +186,29 @@ class TestStats:
         page3 = client.get("/stats?page=3&limit=2").json()
         assert len(page3["links"]) == 1
 
+    def test_cursor_pagination(self, client):
+        for i in range(5):
+            client.post("/links", json={"target_url": f"https://fiverr.com/c{i}/svc"})
+
+        page1 = client.get("/stats?limit=2").json()
+        assert page1["has_more"] is True
+
+        page2 = client.get(f"/stats?limit=2&cursor={page1['next_cursor']}").json()
+        assert page2["total_links"] == 5
+        assert page2["has_more"] is True
+
+        page3 = client.get(f"/stats?limit=2&cursor={page2['next_cursor']}").json()
+        assert len(page3["links"]) == 1
+        assert page3["has_more"] is False
+        assert page3["next_cursor"] is None
+
+        codes = [l["short_code"] for p in (page1, page2, page3) for l in p["links"]]
+        assert len(set(codes)) == 5
+
+    def test_invalid_cursor_rejected(self, client):
+        resp = client.get("/stats?cursor=not-a-cursor")
+        assert resp.status_code == 400
+
     def test_limit_capped_at_100(self, client):
         resp = client.get("/stats?limit=200")
         # FastAPI Query(le=100) rejects this
@@ -149,3 +241,16 @@ class TestStats:
         assert link["monthly_breakdown"][0]["clicks"] == 1
         # Month format: YYYY-MM
         assert len(link["monthly_breakdown"][0]["month"]) == 7
+
+    def test_backfill_counts_clicks_missing_from_rollup(self, client, db):
+        resp = client.post("/links", json={"target_url": "https://fiverr.com/test/backfill"})
+        sc = resp.json()["short_code"]
+        link_id = db.query(Link.id).filter(Link.short_code == sc).scalar()
+        db.add_all([Click(link_id=link_id) for _ in range(3)])
+        db.commit()
+
+        backfill_click_monthly(db)
+
+        link = next(l for l in client.get("/stats").json()["links"] if l["short_code"] == sc)
+        assert link["total_clicks"] == 3
+        assert link["monthly_breakdown"][0]["clicks"] == 3
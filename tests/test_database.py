@@ -0,0 +1,28 @@
+"""Tests for the asyncpg URL derived from DATABASE_URL."""
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database import to_asyncpg_url
+
+
+def _connect_args(database_url):
+    url = to_asyncpg_url(database_url)
+    _, kwargs = create_async_engine(url).dialect.create_connect_args(url)
+    return url, kwargs
+
+
+def test_swaps_driver_and_keeps_credentials():
+    url, kwargs = _connect_args("postgresql://user:password@db:5432/fiverr_shortlinks")
+    assert url.drivername == "postgresql+asyncpg"
+    assert kwargs == {"host": "db", "port": 5432, "database": "fiverr_shortlinks", "user": "user", "password": "password"}
+
+
+def test_sslmode_becomes_asyncpg_ssl():
+    _, kwargs = _connect_args("postgresql://u:p@h/db?sslmode=require")
+    assert kwargs["ssl"] == "require"
+    assert "sslmode" not in kwargs
+
+
+def test_other_libpq_params_dropped():
+    _, kwargs = _connect_args("postgresql://u:p@h/db?options=-csearch_path%3Dapp&application_name=api")
+    assert "options" not in kwargs
+    assert "application_name" not in kwargs